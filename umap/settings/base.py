@@ -271,6 +271,7 @@ UMAP_PURGATORY_ROOT = "/tmp/umappurgatory"
 
 UMAP_READONLY = env("UMAP_READONLY", default=False)
 UMAP_GZIP = True
+UMAP_USE_ESBUILD = env.bool("UMAP_USE_ESBUILD", default=False)
 LOCALE_PATHS = [os.path.join(PROJECT_DIR, "locale")]
 
 LEAFLET_LONGITUDE = env.int("LEAFLET_LONGITUDE", default=2)
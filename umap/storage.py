@@ -1,3 +1,9 @@
+import os
+import re
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
 from django.conf import settings
@@ -5,6 +11,141 @@ from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
 from rcssmin import cssmin
 from rjsmin import jsmin
 
+try:
+    # Linear time regexp engine, see the "re2" extra.
+    import re2
+except ImportError:
+    re2 = None
+
+# When enabled and available, esbuild minifies all the files in one (fast) run.
+ESBUILD = shutil.which("esbuild")
+
+
+def is_minified(content):
+    return b"sourceMappingURL" in content
+
+
+def minify(path):
+    if path.suffix == ".js":
+        minifier = jsmin
+    elif path.suffix == ".css":
+        minifier = cssmin
+    else:
+        return
+    # Both minifiers work on bytes, so no need to decode and encode again.
+    initial = path.read_bytes()
+    if not is_minified(initial):
+        # Write aside then rename, so a crash never leaves a truncated file.
+        tmp = path.with_suffix(f"{path.suffix}.tmp")
+        try:
+            tmp.write_bytes(minifier(initial))
+            # Keep the mode set by the storage, not the one from the umask.
+            shutil.copymode(path, tmp)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+
+def esbuild(paths, root):
+    paths = [path for path in paths if not is_minified(path.read_bytes())]
+    if paths:
+        subprocess.run(
+            [
+                ESBUILD,
+                "--minify",
+                "--allow-overwrite",
+                "--log-level=warning",
+                f"--outbase={root}",
+                f"--outdir={root}",
+                *paths,
+            ],
+            check=True,
+        )
+
+
+# Characters RE2 does not match like the stdlib, found by comparing both engines
+# on every code point: the whitespaces missing from its (ASCII only) \\s, and the
+# dotted and dotless i, which it does not fold to i.
+RE2_MISMATCH = re.compile(
+    "[\x0b\x1c-\x1f\x85\xa0\u0130\u0131\u1680\u2000-\u200a"
+    "\u2028\u2029\u202f\u205f\u3000]"
+)
+# Other classes which are Unicode aware in the stdlib only.
+UNICODE_CLASSES = re.compile(r"\\[wWbBdD]")
+
+
+@lru_cache(maxsize=8)
+def re2_compatible(string):
+    """Tell if RE2 matches the string like the stdlib (patterns from linear())."""
+    return not RE2_MISMATCH.search(string)
+
+
+class LinearPattern:
+    """Compiled pattern using RE2 for the strings where it matches like the stdlib."""
+
+    def __init__(self, pattern, fast):
+        self.pattern = pattern
+        self.fast = fast
+
+    def sub(self, repl, string):
+        if re2_compatible(string):
+            return self.fast.sub(repl, string)
+        return self.pattern.sub(repl, string)
+
+
+def linear(pattern):
+    """Return a linear time version of the pattern if RE2 is available."""
+    # RE2_MISMATCH has only been checked for ASCII patterns without those classes.
+    if (
+        re2 is None
+        or not pattern.pattern.isascii()
+        or UNICODE_CLASSES.search(pattern.pattern)
+    ):
+        return pattern
+    options = re2.Options()
+    options.case_sensitive = not pattern.flags & re.IGNORECASE
+    try:
+        return LinearPattern(pattern, re2.compile(pattern.pattern, options))
+    except re2.error:  # Unsupported syntax, e.g. backreferences.
+        return pattern
+
+
+# Every pattern of an extension needs one of these strings (case insensitive) to
+# match, so they are looked for first, which is way faster than the patterns.
+PREFILTERS = {
+    "*.css": ("url(", "@import", "sourceMappingURL"),
+    "*.js": ("import", "export", "sourceMappingURL"),
+}
+
+
+@lru_cache
+def literals_regex(literals):
+    # Same engine and flag as the patterns, so same case folding.
+    return re.compile("|".join(re.escape(literal) for literal in literals), re.I)
+
+
+@lru_cache(maxsize=8)
+def contains_any(string, literals):
+    """Case insensitive search of the literals in the string.
+
+    Cached, as the patterns of an extension run one after the other on the same
+    content, which is not changed when no pattern matches.
+    """
+    return literals_regex(literals).search(string) is not None
+
+
+class PrefilteredPattern:
+    """Compiled pattern which does not run on strings lacking all its literals."""
+
+    def __init__(self, pattern, literals):
+        self.pattern = pattern
+        self.literals = tuple(literals)
+
+    def sub(self, repl, string):
+        if not contains_any(string, self.literals):
+            return string
+        return self.pattern.sub(repl, string)
+
 
 class UmapManifestStaticFilesStorage(ManifestStaticFilesStorage):
     support_js_module_import_aggregation = True
@@ -43,22 +184,35 @@ class UmapManifestStaticFilesStorage(ManifestStaticFilesStorage):
         ),
     )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Most files do not contain any URL to rewrite.
+        for extension, patterns in self._patterns.items():
+            literals = PREFILTERS.get(extension)
+            compiled = []
+            for pattern, template in patterns:
+                pattern = linear(pattern)
+                if literals:
+                    pattern = PrefilteredPattern(pattern, literals)
+                compiled.append((pattern, template))
+            self._patterns[extension] = compiled
+
     def post_process(self, paths, **options):
-        collected = super().post_process(paths, **options)
+        collected = list(super().post_process(paths, **options))
+        # A file can be yielded more than once (one per pass), but we want to
+        # minify it only once, and not concurrently.
+        to_minify = set()
         for original_path, processed_path, processed in collected:
             if isinstance(processed, Exception):
                 print("Error with file", original_path)
                 raise processed
-            if processed_path.endswith(".js"):
-                path = Path(settings.STATIC_ROOT) / processed_path
-                initial = path.read_text()
-                if "sourceMappingURL" not in initial:  # Already minified.
-                    minified = jsmin(initial)
-                    path.write_text(minified)
-            if processed_path.endswith(".css"):
-                path = Path(settings.STATIC_ROOT) / processed_path
-                initial = path.read_text()
-                if "sourceMappingURL" not in initial:  # Already minified.
-                    minified = cssmin(initial)
-                    path.write_text(minified)
+            if processed_path.endswith((".js", ".css")):
+                to_minify.add(Path(settings.STATIC_ROOT) / processed_path)
+        if ESBUILD and settings.UMAP_USE_ESBUILD:
+            esbuild(to_minify, settings.STATIC_ROOT)
+        elif to_minify:
+            # Minifying is CPU bound, and each file is independent.
+            with ProcessPoolExecutor() as executor:
+                list(executor.map(minify, to_minify, chunksize=8))
+        for original_path, processed_path, processed in collected:
             yield original_path, processed_path, True
@@ -40,6 +40,14 @@ def test_removing_one():
     assert merge_features(["A", "B"], ["A", "B", "C"], ["A", "D"]) == ["A", "C", "D"]
 
 
+def test_fast_forward():
+    assert merge_features(["A", "B"], ["A", "B"], ["B", "C", "A"]) == ["B", "C", "A"]
+
+
+def test_no_incoming_change():
+    assert merge_features(["A", "B"], ["A", "C"], ["A", "B"]) == ["A", "C"]
+
+
 def test_removing_same_element():
     # No added element (otherwise we cannot know if "new" elements are old modified
     # or old removed and new added).
@@ -59,6 +67,13 @@ def test_changing_removed_element():
         merge_features(["A", "B"], ["A"], ["A", "C"])
 
 
+def test_removing_duplicated_element():
+    assert merge_features(["A", "A", "B"], ["A", "A", "B", "C"], ["B"]) == ["B", "C"]
+    # One of the duplicates was already removed in latest.
+    with pytest.raises(ConflictError):
+        merge_features(["A", "A", "B"], ["A", "B"], ["B"])
+
+
 def test_changing_same_element():
     with pytest.raises(ConflictError):
         merge_features(["A", "B"], ["A", "D"], ["A", "C"])
@@ -85,3 +100,22 @@ def test_merge_with_ids_raises():
 
     with pytest.raises(ConflictError):
         merge_features(reference, latest, incoming)
+
+
+def test_merge_features_with_geojson():
+    reference = [
+        {"type": "Feature", "properties": {"name": "A"}, "geometry": {"x": [1, 2]}},
+        {"type": "Feature", "properties": {"name": "B"}, "geometry": {"x": [3, 4]}},
+    ]
+    latest = reference + [
+        {"type": "Feature", "properties": {"name": "C"}, "geometry": {"x": [5, 6]}},
+    ]
+    incoming = [
+        reference[0],
+        {"type": "Feature", "properties": {"name": "D"}, "geometry": {"x": [7, 8]}},
+    ]
+    assert merge_features(reference, latest, incoming) == [
+        reference[0],
+        latest[2],
+        incoming[1],
+    ]
@@ -1,5 +1,7 @@
 import json
+import re
 import shutil
+import sys
 import tempfile
 from copy import deepcopy
 from pathlib import Path
@@ -7,16 +9,61 @@ from pathlib import Path
 import pytest
 from django.core.management import call_command
 
+from umap.storage import (
+    LinearPattern,
+    PrefilteredPattern,
+    UmapManifestStaticFilesStorage,
+    re2_compatible,
+)
 
-@pytest.fixture
-def staticfiles(settings):
-    static_root = tempfile.mkdtemp(prefix="test_static")
+# Content to run the storage patterns on, matching or not.
+SAMPLES = {
+    "*.css": [
+        "body { color: red; }",
+        "a { background: url('img/a.png'); }",
+        "a { background: URL(img/a.png); }",
+        '@import "base.css";',
+        '@IMPORT "base.css";',
+        "/*# sourceMappingURL=a.css.map */",
+        "a { background: url(\u00a0'img/a.png'); }",
+        "/* Café… */ a { background: url('img/é.png'); }",
+    ],
+    "*.js": [
+        "const a = 1",
+        'import { a } from "./a.js"\n',
+        'import "./a.js"\n',
+        'import\u00a0"./a.js"\n',
+        'import\v"./a.js"\n',
+        '// Café…\nimport "./é.js"\n',
+        '\u0130MPORT "./a.js"\n',
+        'IMPORT "./a.js"\n',
+        '\u0131mport("./a.js").then',
+        'export * from "./a.js"\n',
+        'await import("./a.js")',
+        "//# sourceMappingURL=a.js.map",
+    ],
+}
+
+
+def replace(match):
+    return f"<{match.group('matched')}>"
+
+
+def use_umap_storage(settings, static_root):
     settings.STATIC_ROOT = static_root
     # Make sure settings are properly reset after the test
     settings.STORAGES = deepcopy(settings.STORAGES)
     settings.STORAGES["staticfiles"]["BACKEND"] = (
         "umap.storage.UmapManifestStaticFilesStorage"
     )
+
+
+@pytest.fixture
+def staticfiles(settings):
+    static_root = tempfile.mkdtemp(prefix="test_static")
+    use_umap_storage(settings, static_root)
+    # Do not depend on the environment.
+    settings.UMAP_USE_ESBUILD = False
     try:
         call_command("collectstatic", "--noinput")
         yield
@@ -38,3 +85,148 @@ def test_collectstatic_ran_successfully_with_hashes(settings, staticfiles):
         len(json_manifest["paths"]["umap/base.css"])
         == len("umap/base.css") + md5_hash_lenght
     )
+
+
+@pytest.mark.parametrize("path", ["umap/js/umap.js", "umap/base.css"])
+def test_collectstatic_minified_files(settings, staticfiles, path):
+    static_root = Path(settings.STATIC_ROOT)
+    manifest = json.loads((static_root / "staticfiles.json").read_text())
+    source = Path(__file__).parent.parent / "static" / path
+    collected = static_root / manifest["paths"][path]
+    content = collected.read_text()
+    assert "/*" not in content
+    assert len(content) < len(source.read_text())
+
+
+def test_collectstatic_without_js_nor_css(settings, tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("No process pool should be created")
+
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "robots.txt").write_text("User-agent: *\n")
+    settings.STATICFILES_DIRS = [str(source)]
+    settings.STATICFILES_FINDERS = [
+        "django.contrib.staticfiles.finders.FileSystemFinder"
+    ]
+    use_umap_storage(settings, str(tmp_path / "static"))
+    monkeypatch.setattr("umap.storage.ProcessPoolExecutor", fail)
+    call_command("collectstatic", "--noinput")
+    assert (tmp_path / "static" / "robots.txt").exists()
+
+
+@pytest.fixture
+def fake_esbuild(monkeypatch, tmp_path):
+    """Fake esbuild executable, which only records its arguments."""
+    log = tmp_path / "esbuild.json"
+    executable = tmp_path / "esbuild"
+    executable.write_text(
+        f"#!{sys.executable}\n"
+        "import json, sys\n"
+        f"with open({str(log)!r}, 'w') as f:\n"
+        "    json.dump(sys.argv[1:], f)\n"
+    )
+    executable.chmod(0o755)
+    monkeypatch.setattr("umap.storage.ESBUILD", str(executable))
+    return log
+
+
+def test_collectstatic_with_esbuild(settings, tmp_path, fake_esbuild):
+    static_root = tmp_path / "static"
+    use_umap_storage(settings, str(static_root))
+    settings.UMAP_USE_ESBUILD = True
+    call_command("collectstatic", "--noinput")
+    args = json.loads(fake_esbuild.read_text())
+    assert f"--outbase={static_root}" in args
+    assert f"--outdir={static_root}" in args
+    paths = {Path(arg) for arg in args if not arg.startswith("--")}
+    assert any(path.suffix == ".js" for path in paths)
+    assert any(path.suffix == ".css" for path in paths)
+    # Files already minified must be left out.
+    minified = {
+        path
+        for path in static_root.rglob("*")
+        if path.suffix in (".js", ".css") and b"sourceMappingURL" in path.read_bytes()
+    }
+    assert minified
+    assert not paths & minified
+
+
+def test_collectstatic_without_esbuild(settings, tmp_path, fake_esbuild):
+    use_umap_storage(settings, str(tmp_path / "static"))
+    settings.UMAP_USE_ESBUILD = False
+    call_command("collectstatic", "--noinput")
+    assert not fake_esbuild.exists()
+
+
+def test_storage_patterns_are_prefiltered():
+    storage = UmapManifestStaticFilesStorage()
+    assert set(storage._patterns) == set(SAMPLES)
+    for patterns in storage._patterns.values():
+        for pattern, template in patterns:
+            assert isinstance(pattern, PrefilteredPattern)
+
+
+def test_prefilter_does_not_change_the_result():
+    storage = UmapManifestStaticFilesStorage()
+    for extension, patterns in storage._patterns.items():
+        for pattern, template in patterns:
+            for sample in SAMPLES[extension]:
+                assert pattern.sub(replace, sample) == pattern.pattern.sub(
+                    replace, sample
+                )
+
+
+def test_re2_matches_like_stdlib():
+    pytest.importorskip("re2")
+    storage = UmapManifestStaticFilesStorage()
+    for extension, patterns in storage._patterns.items():
+        for pattern, template in patterns:
+            linear = pattern.pattern
+            assert isinstance(linear, LinearPattern)
+            for sample in SAMPLES[extension]:
+                expected = linear.pattern.sub(replace, sample)
+                assert linear.sub(replace, sample) == expected
+                # RE2 itself only gets the strings where it behaves the same.
+                if re2_compatible(sample):
+                    assert linear.fast.sub(replace, sample) == expected
+
+
+def test_re2_is_not_used_for_non_ascii_whitespace():
+    pytest.importorskip("re2")
+    storage = UmapManifestStaticFilesStorage()
+    linear = storage._patterns["*.js"][3][0].pattern  # import "./a.js"
+    sample = 'import\u00a0"./a.js"\n'
+    assert linear.fast.sub(replace, sample) == sample
+    assert linear.sub(replace, sample) != sample
+
+
+def test_prefiltered_pattern_skips_strings_without_literal():
+    def fail(match):
+        raise AssertionError("Pattern should not run")
+
+    pattern = PrefilteredPattern(
+        re.compile(r"(?P<matched>url\((?P<url>.*?)\))"), ["url("]
+    )
+    assert pattern.sub(fail, "body { color: red; }") == "body { color: red; }"
+
+
+def test_prefiltered_pattern_is_case_insensitive():
+    pattern = PrefilteredPattern(
+        re.compile(r"(?P<matched>url\((?P<url>.*?)\))", re.IGNORECASE), ["url("]
+    )
+    assert pattern.sub(lambda match: "X", "a { b: URL(c.png); }") == "a { b: X; }"
+    # Same case folding as the patterns, including the special ones.
+    pattern = PrefilteredPattern(re.compile("import", re.IGNORECASE), ["import"])
+    assert pattern.sub(lambda match: "X", "\u0131mport") == "X"
+
+
+def test_no_prefilter_for_unknown_extensions():
+    class Storage(UmapManifestStaticFilesStorage):
+        patterns = UmapManifestStaticFilesStorage.patterns + (
+            ("*.svg", (r"""(?P<matched>href=["'](?P<url>.*?)["'])""",)),
+        )
+
+    storage = Storage()
+    (pattern, template) = storage._patterns["*.svg"][0]
+    assert not isinstance(pattern, PrefilteredPattern)
@@ -1,6 +1,15 @@
+import gzip
 from pathlib import Path
 
-from umap.utils import gzip_file
+from django.urls import include, path
+from django.utils import translation
+
+from umap.utils import (
+    _urls_for_js,
+    decorated_patterns,
+    get_uri_template,
+    gzip_file,
+)
 
 
 def test_gzip_file():
@@ -12,3 +21,79 @@ def test_gzip_file():
     dest_stat = dest.stat()
     dest.unlink()
     assert src_stat.st_mtime == dest_stat.st_mtime
+
+
+def test_gzip_file_content():
+    src = Path(__file__).parent / "settings.py"
+    dest = Path("/tmp/test_settings_content.py.gz")
+    gzip_file(src, dest)
+    with gzip.open(dest, "rb") as f:
+        content = f.read()
+    dest.unlink()
+    assert content == src.read_bytes()
+
+
+def test_uri_template_depends_on_language():
+    with translation.override("fr"):
+        assert get_uri_template("map_create") == "/fr/map/create/"
+    with translation.override("en"):
+        assert get_uri_template("map_create") == "/en/map/create/"
+
+
+def test_uri_template_with_args():
+    with translation.override("en"):
+        assert (
+            get_uri_template("map_update", args=["map_id"])
+            == "/en/map/{map_id}/update/settings/"
+        )
+
+
+def test_urls_for_js_cache(settings):
+    settings.UMAP_EXTRA_URLS = {"routing": "https://example.org/{lat}/{lng}"}
+    with translation.override("en"):
+        urls = _urls_for_js()
+        assert urls["routing"] == "https://example.org/{lat}/{lng}"
+        assert urls["map_create"] == "/en/map/create/"
+        urls["map_create"] = "changed"
+        assert _urls_for_js()["map_create"] == "/en/map/create/"
+    with translation.override("fr"):
+        assert _urls_for_js()["map_create"] == "/fr/map/create/"
+    # Changing a setting invalidates the cache.
+    settings.UMAP_EXTRA_URLS = {"routing": "https://example.com/{lat}/{lng}"}
+    with translation.override("en"):
+        assert _urls_for_js()["routing"] == "https://example.com/{lat}/{lng}"
+
+
+def test_decorated_patterns():
+    def view(request):
+        return ["view"]
+
+    def decorator(name):
+        def decorate(func):
+            return lambda request: func(request) + [name]
+
+        return decorate
+
+    urls = decorated_patterns(
+        [decorator("first"), decorator("second")],
+        path("foo/", view),
+        path("", include([path("bar/", view)])),
+    )
+    # Resolve once before adding a decorator, to make sure it is not cached.
+    assert urls[0].resolve("foo/").func(None) == ["view", "first", "second"]
+    urls = decorated_patterns(decorator("third"), *urls)
+    for url in ["foo/", "bar/"]:
+        match = next(filter(None, (pattern.resolve(url) for pattern in urls)))
+        assert match.func(None) == ["view", "first", "second", "third"]
+
+
+def test_decorated_patterns_decorate_once():
+    calls = []
+
+    def decorator(func):
+        calls.append(func)
+        return func
+
+    (url,) = decorated_patterns(decorator, path("foo/", lambda request: None))
+    assert url.resolve("foo/").func is url.resolve("foo/").func
+    assert len(calls) == 1
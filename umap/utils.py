@@ -1,10 +1,32 @@
-import gzip
 import json
 import os
+import shutil
+from collections import Counter
+from functools import lru_cache
+from itertools import chain
 
 from django.conf import settings
 from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils.functional import cached_property
+from django.utils.translation import get_language
+
+try:
+    # Much faster drop-in replacement, see the "gzip" extra.
+    from isal import igzip as gzip
+except ImportError:
+    import gzip
+
+# Templated URLs for javascript, per language (because of i18n_patterns).
+_JS_URLS = {}
+
+
+@receiver(setting_changed)
+def _clear_urls_cache(**kwargs):
+    _JS_URLS.clear()
+    _get_uri_template.cache_clear()
 
 
 def _urls_for_js(urls=None):
@@ -12,13 +34,19 @@ def _urls_for_js(urls=None):
     Return templated URLs prepared for javascript.
     """
     if urls is None:
-        # prevent circular import
-        from .urls import i18n_urls, urlpatterns
-
-        urls = [
-            url.name for url in urlpatterns + i18n_urls if getattr(url, "name", None)
-        ]
-    urls = dict(zip(urls, [get_uri_template(url) for url in urls]))
+        language = get_language()
+        if language not in _JS_URLS:
+            # prevent circular import
+            from .urls import i18n_urls, urlpatterns
+
+            _JS_URLS[language] = _urls_for_js(
+                url.name
+                for url in chain(urlpatterns, i18n_urls)
+                if getattr(url, "name", None)
+            )
+        # Callers may alter the returned dict.
+        return dict(_JS_URLS[language])
+    urls = {url: get_uri_template(url) for url in urls}
     urls.update(getattr(settings, "UMAP_EXTRA_URLS", {}))
     return urls
 
@@ -37,7 +65,12 @@ def get_uri_template(urlname, args=None, prefix=""):
       whose optional parameters match those you specified (a parameter
       is considered optional if it doesn't appear in every pattern possibility)
     """
+    # Resolved patterns depend on the active language, so it is part of the key.
+    return _get_uri_template(urlname, frozenset(args or ()), prefix, get_language())
+
 
+@lru_cache(maxsize=4096)
+def _get_uri_template(urlname, args, prefix, language):
     def _convert(template, args=None):
         """URI template converter"""
         if not args:
@@ -64,27 +97,33 @@ def get_uri_template(urlname, args=None, prefix=""):
             # If there are optionnal arguments passed, use them to try to find
             # the correct pattern.
             # First, we need to build a list with all the arguments
-            seen_params = []
-            for result, params in possibility:
-                seen_params.append(params)
+            seen_params = [params for result, params in possibility]
+            if not seen_params:
+                continue
             # Then build a set to find the common ones, and use it to build the
-            # list of all the expected params
-            common_params = reduce(lambda x, y: set(x) & set(y), seen_params)
-            expected_params = sorted(common_params.union(args))
+            # set of all the expected params
+            common_params = set(seen_params[0]).intersection(*seen_params[1:])
+            expected_params = common_params.union(args)
             # Then loop again over the pattern possibilities and return
             # the first one that strictly match expected params
             for result, params in possibility:
-                if sorted(params) == expected_params:
+                if expected_params == frozenset(params):
                     return _convert(result, params)
     return None
 
 
 class DecoratedURLPattern(URLPattern):
+    @cached_property
+    def decorated_callback(self):
+        callback = self.callback
+        for func in self._decorate_with:
+            callback = func(callback)
+        return callback
+
     def resolve(self, *args, **kwargs):
         result = URLPattern.resolve(self, *args, **kwargs)
         if result:
-            for func in self._decorate_with:
-                result.func = func(result.func)
+            result.func = self.decorated_callback
         return result
 
 
@@ -101,67 +140,92 @@ def decorated_patterns(func, *urls):
     ] + decorated_patterns(login_required, url(r'^', include('cms.urls')),
     """
 
-    def decorate(urls, func):
-        for url in urls:
-            if isinstance(url, URLPattern):
-                url.__class__ = DecoratedURLPattern
-                if not hasattr(url, "_decorate_with"):
-                    setattr(url, "_decorate_with", [])
-                url._decorate_with.append(func)
-            elif isinstance(url, URLResolver):
-                for pp in url.url_patterns:
-                    if isinstance(pp, URLPattern):
-                        pp.__class__ = DecoratedURLPattern
-                        if not hasattr(pp, "_decorate_with"):
-                            setattr(pp, "_decorate_with", [])
-                        pp._decorate_with.append(func)
-
-    if func:
-        if not isinstance(func, (list, tuple)):
-            func = [func]
-        for f in func:
-            decorate(urls, f)
+    if not func:
+        return urls
+    if not isinstance(func, (list, tuple)):
+        func = [func]
+
+    patterns = []
+    for url in urls:
+        if isinstance(url, URLPattern):
+            patterns.append(url)
+        elif isinstance(url, URLResolver):
+            patterns.extend(pp for pp in url.url_patterns if isinstance(pp, URLPattern))
+
+    for pattern in patterns:
+        if not isinstance(pattern, DecoratedURLPattern):
+            pattern.__class__ = DecoratedURLPattern
+            pattern._decorate_with = []
+        pattern._decorate_with.extend(func)
+        # Decorators changed, the callback must be decorated again.
+        pattern.__dict__.pop("decorated_callback", None)
 
     return urls
 
 
 def gzip_file(from_path, to_path):
-    stat = os.stat(from_path)
-    with open(from_path, "rb") as f_in:
-        with gzip.open(to_path, "wb") as f_out:
-            f_out.writelines(f_in)
-    os.utime(to_path, ns=(stat.st_mtime_ns, stat.st_mtime_ns))
+    with open(from_path, "rb") as f_in, open(to_path, "wb") as raw:
+        stat = os.fstat(f_in.fileno())
+        with gzip.GzipFile(fileobj=raw, mode="wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, 256 * 1024)
+        raw.flush()
+        os.utime(raw.fileno(), ns=(stat.st_mtime_ns, stat.st_mtime_ns))
 
 
 def is_ajax(request):
-    return request.headers.get("x-requested-with") == "XMLHttpRequest"
+    # Use META directly, request.headers is built (and normalized) lazily.
+    return request.META.get("HTTP_X_REQUESTED_WITH") == "XMLHttpRequest"
 
 
 class ConflictError(ValueError):
     pass
 
 
+def _freeze(obj):
+    """Return a hashable equivalent of a JSON like object, for fast lookups."""
+    if isinstance(obj, dict):
+        return frozenset((key, _freeze(value)) for key, value in obj.items())
+    if isinstance(obj, list):
+        return tuple(_freeze(item) for item in obj)
+    return obj
+
+
 def merge_features(reference: list, latest: list, incoming: list):
     """Finds the changes between reference and incoming, and reapplies them on top of latest."""
     if latest == incoming:
         return latest
+    # Nothing changed on the incoming side.
+    if reference == incoming:
+        return latest
+    # Nothing changed on the latest side, this is a fast-forward.
+    if reference == latest:
+        return incoming
 
-    removed = [item for item in reference if item not in incoming]
-    added = [item for item in incoming if item not in reference]
+    reference_keys = [_freeze(item) for item in reference]
+    incoming_keys = [_freeze(item) for item in incoming]
+    latest_keys = [_freeze(item) for item in latest]
 
-    # Ensure that items changed in the reference weren't also changed in the latest.
-    for item in removed:
-        if item not in latest:
-            raise ConflictError()
+    incoming_set = set(incoming_keys)
+    reference_set = set(reference_keys)
+    removed = Counter(key for key in reference_keys if key not in incoming_set)
+    added = [
+        item for item, key in zip(incoming, incoming_keys) if key not in reference_set
+    ]
 
-    merged = latest[:]
+    # Ensure that items changed in the reference weren't also changed in the latest.
+    # Compare counts, as a feature may be duplicated.
+    if not removed <= Counter(latest_keys):
+        raise ConflictError()
 
     # Reapply the changes on top of the latest.
-    for item in removed:
-        merged.remove(item)
+    merged = []
+    for item, key in zip(latest, latest_keys):
+        if removed[key]:
+            removed[key] -= 1
+        else:
+            merged.append(item)
 
-    for item in added:
-        merged.append(item)
+    merged.extend(added)
 
     return merged
 